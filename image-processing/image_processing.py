@@ -1,11 +1,19 @@
 import os
+import re
 import time
 import io
-import base64
 import logging
+import collections
+import concurrent.futures
 import boto3
 from botocore.config import Config
+from botocore.exceptions import ClientError
 from PIL import Image, ImageOps # Pillow library for image processing. 11.3.0 supports AVIF natively.
+try:
+    # pybase64 uses SIMD (AVX2/SSSE3/NEON) codecs and is a drop-in replacement for the base64 module
+    import pybase64 as base64
+except ImportError:
+    import base64
 
 # Configure logging
 logger = logging.getLogger()
@@ -26,9 +34,59 @@ S3_ORIGINAL_IMAGE_BUCKET = os.environ.get('originalImageBucketName')
 S3_TRANSFORMED_IMAGE_BUCKET = os.environ.get('transformedImageBucketName')
 S3_ORIGINAL_MRAP_ARN = os.environ.get('originalBucketMRAPArn')
 S3_TRANSFORMED_MRAP_ARN = os.environ.get('transformedBucketMRAPArn')
-TRANSFORMED_IMAGE_CACHE_TTL = os.environ.get('transformedImageCacheTTL')
+TRANSFORMED_IMAGE_CACHE_TTL = int(os.environ.get('transformedImageCacheTTL', 3600))
 TRANSFORM_REGION = os.environ.get('transformedRegion')
 DEFAULT_IMAGE_QUALITY = int(os.environ.get('defaultImageQuality', 75))
+# Headers shared by every successful image response
+TRANSFORMED_IMAGE_CACHE_CONTROL = f'max-age={TRANSFORMED_IMAGE_CACHE_TTL}'
+RESPONSE_HEADERS = {
+    'Cache-Control': TRANSFORMED_IMAGE_CACHE_CONTROL,
+    'x-transformed-in': TRANSFORM_REGION
+}
+# Tagging and metadata shared by every uploaded transformed image
+TRANSFORMED_IMAGE_TAGGING = f'transformedIn={TRANSFORM_REGION}'
+TRANSFORMED_IMAGE_METADATA = {'transformedIn': TRANSFORM_REGION}
+# AV1 encoder used by libavif ('auto', 'aom', 'rav1e' or 'svt') and its speed preset (0 = slowest/best, 10 = fastest)
+AVIF_CODEC = os.environ.get('avifCodec', 'auto')
+AVIF_SPEED = int(os.environ.get('avifSpeed', 8))
+# Output formats keyed by the Pillow format of the originals they can be served from unchanged.
+# MPO is how Pillow reports JPEGs carrying a multi-picture index (e.g. from phone cameras).
+PASS_THROUGH_FORMATS = {
+    'JPEG': 'jpeg',
+    'MPO': 'jpeg',
+    'GIF': 'gif',
+    'WEBP': 'webp',
+    'PNG': 'png',
+    'AVIF': 'avif'
+}
+# Byte markers of EXIF (JPEG/AVIF 'Exif', WebP 'EXIF', PNG 'eXIf') and XMP metadata. Originals containing any of
+# them are always re-encoded, which drops the metadata (GPS position, camera serial, ...) and applies the EXIF orientation.
+# A marker that only appears by chance in compressed data merely costs a re-encode.
+METADATA_MARKERS = (b'Exif', b'EXIF', b'eXIf', b'<x:xmpmeta', b'http://ns.adobe.com/xap/1.0/')
+# Image modes the JPEG encoder can write directly
+JPEG_MODES = ('1', 'L', 'RGB', 'RGBX', 'CMYK', 'YCbCr')
+# Pillow formats that can carry an EXIF orientation tag
+EXIF_FORMATS = ('JPEG', 'MPO', 'PNG', 'WEBP')
+# Resampling filters that can be requested with the filter operation
+RESAMPLING_FILTERS = {
+    'nearest': Image.Resampling.NEAREST,
+    'box': Image.Resampling.BOX,
+    'bilinear': Image.Resampling.BILINEAR,
+    'hamming': Image.Resampling.HAMMING,
+    'bicubic': Image.Resampling.BICUBIC,
+    'lanczos': Image.Resampling.LANCZOS
+}
+# Matches the name=value pairs of the operations path segment (e.g. format=jpeg,width=100),
+# anchored to whole comma-separated operations so 'max-width=50' or 'Width=100' don't match
+OPERATIONS_PATTERN = re.compile(r'(?:^|,)([a-z]+)=([^,]+)(?=,|$)')
+# Originals larger than one block are downloaded as parallel ranged GETs
+S3_PREFETCH_BLOCK_SIZE = 8 * 1024 * 1024
+S3_PREFETCH_BLOCK_COUNT = 4
+# Limits for the in-memory cache of recently transformed images (set memoryCacheMaxBytes=0 to disable it)
+MEMORY_CACHE_MAX_ENTRIES = 64
+MEMORY_CACHE_MAX_BYTES = int(os.environ.get('memoryCacheMaxBytes', 64 * 1024 * 1024))
+# Seconds the handler waits for the transformed image upload before returning
+UPLOAD_WAIT_TIMEOUT = float(os.environ.get('uploadWaitTimeout', 5))
 
 
 def get_mrap_alias(mrap_arn):
@@ -66,6 +124,127 @@ else:
     transformed_bucket_s3_client = s3Client
     logger.info('Using standard S3 endpoints (non-MRAP)')
 
+# Thread pool used to overlap the original image download with other work in the handler
+download_executor = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+
+def warm_up_pillow():
+    """Exercise Pillow's image creation and resampling code paths once so the first request doesn't pay for it"""
+    return Image.new('RGB', (1, 1)).resize((2, 2))
+
+# Warm up Pillow in the background during cold start
+download_executor.submit(warm_up_pillow)
+
+# Thread pool used to fetch the blocks of large original images in parallel
+prefetch_executor = concurrent.futures.ThreadPoolExecutor(max_workers=S3_PREFETCH_BLOCK_COUNT)
+
+def read_original_image_block(bucket, key, etag, start, end, buffer):
+    """Download the byte range [start, end] of the original image into the matching slice of buffer"""
+    response = original_bucket_s3_client.get_object(Bucket=bucket, Key=key, Range=f'bytes={start}-{end}', IfMatch=etag)
+    buffer[start:end + 1] = response["Body"].read()
+
+def download_original_image(bucket, key):
+    """Download the original image, fetching everything past the first block as parallel ranged GETs.
+    Returns the content type and a file object holding the image."""
+    try:
+        firstBlock = original_bucket_s3_client.get_object(Bucket=bucket, Key=key, Range=f'bytes=0-{S3_PREFETCH_BLOCK_SIZE - 1}')
+    except ClientError as error:
+        # A ranged GET of a zero-byte object fails with InvalidRange, fetch it whole instead
+        if error.response.get('Error', {}).get('Code') != 'InvalidRange':
+            raise
+        emptyObject = original_bucket_s3_client.get_object(Bucket=bucket, Key=key)
+        return emptyObject.get("ContentType"), emptyObject["Body"]
+    contentType = firstBlock.get("ContentType")
+    # ContentRange has the form 'bytes 0-8388607/20971520'
+    totalSize = int(firstBlock["ContentRange"].split('/')[-1])
+    if totalSize <= S3_PREFETCH_BLOCK_SIZE:
+        return contentType, firstBlock["Body"]
+
+    # Pre-size the buffer and write the blocks straight into it, so the file object handed to Pillow
+    # is the only full copy of the original
+    body = io.BytesIO()
+    body.seek(totalSize - 1)
+    body.write(b'\0')
+    with body.getbuffer() as buffer:
+        # Pin the remaining blocks to the same object version as the first one
+        futures = [
+            prefetch_executor.submit(read_original_image_block, bucket, key, firstBlock["ETag"], start, min(start + S3_PREFETCH_BLOCK_SIZE, totalSize) - 1, buffer)
+            for start in range(S3_PREFETCH_BLOCK_SIZE, totalSize, S3_PREFETCH_BLOCK_SIZE)
+        ]
+        try:
+            buffer[:S3_PREFETCH_BLOCK_SIZE] = firstBlock["Body"].read()
+        finally:
+            # Don't release the buffer while blocks are still being written into it
+            concurrent.futures.wait(futures)
+        for future in futures:
+            future.result()
+    # getvalue() trims the buffer's own bytes object in place, and a BytesIO wrapping that object shares it.
+    # A later full read() returns the same object too, so callers never copy the original.
+    return contentType, io.BytesIO(body.getvalue())
+
+def to_jpeg_compatible(image):
+    """Convert an image to a mode the JPEG encoder can write, dropping any transparency.
+    Grayscale images stay single-channel, which is a third of the encoding work of RGB."""
+    if image.mode in JPEG_MODES:
+        return image
+    if image.mode == 'LA':
+        return image.convert('L')
+    return image.convert('RGB')
+
+# Recently transformed images kept in least-recently-used order across warm invocations,
+# keyed by (originalImagePath, operationsPrefix) with (contentType, transformedImageBytes) values
+memory_cache = collections.OrderedDict()
+memory_cache_bytes = 0
+
+def get_cached_image(key):
+    """Return the cached (contentType, transformedImageBytes) for key, or None on a miss"""
+    entry = memory_cache.get(key)
+    if entry is not None:
+        memory_cache.move_to_end(key)
+    return entry
+
+def cache_image(key, contentType, transformedImageBytes):
+    """Add a transformed image to the cache, evicting the least recently used images to stay within its limits"""
+    global memory_cache_bytes
+    if len(transformedImageBytes) > MEMORY_CACHE_MAX_BYTES:
+        return
+    previous = memory_cache.pop(key, None)
+    if previous is not None:
+        memory_cache_bytes -= len(previous[1])
+    memory_cache[key] = (contentType, transformedImageBytes)
+    memory_cache_bytes += len(transformedImageBytes)
+    while len(memory_cache) > MEMORY_CACHE_MAX_ENTRIES or memory_cache_bytes > MEMORY_CACHE_MAX_BYTES:
+        _, (_, evictedBytes) = memory_cache.popitem(last=False)
+        memory_cache_bytes -= len(evictedBytes)
+
+# Thread pool used to upload transformed images while the response is being encoded
+upload_executor = concurrent.futures.ThreadPoolExecutor(max_workers=4)
+
+def upload_transformed_image(transformedImageBytes, contentType, originalImagePath, operationsPrefix):
+    """Upload a transformed image to the transformed images bucket, logging instead of raising on failure"""
+    startTime = time.perf_counter() * 1000
+    try:
+        # Determine the bucket/ARN to use for uploading
+        upload_bucket = S3_TRANSFORMED_MRAP_ARN if S3_TRANSFORMED_MRAP_ARN else S3_TRANSFORMED_IMAGE_BUCKET
+        upload_key = f"{originalImagePath}/{operationsPrefix}"
+        logger.info(f"Uploading transformed image to bucket/ARN '{upload_bucket}' with key '{upload_key}' using endpoint '{transformed_bucket_s3_client.meta.endpoint_url}'")
+
+        transformed_bucket_s3_client.put_object(
+            Bucket=upload_bucket,
+            Key=upload_key,
+            Body=transformedImageBytes,
+            ContentType=contentType,
+            CacheControl=TRANSFORMED_IMAGE_CACHE_CONTROL,
+            Tagging=TRANSFORMED_IMAGE_TAGGING,
+            Metadata={
+                **TRANSFORMED_IMAGE_METADATA,
+                'original-image-key': originalImagePath,
+                'transformations': operationsPrefix
+            }
+        )
+        logger.info(f"Uploaded transformed image '{upload_key}' in {int(time.perf_counter() * 1000 - startTime)} ms")
+    except Exception as error:
+        logError('Could not upload transformed image to S3', error)
+
 def handler(event, context=None):
     # Validate if this is a GET request
     if not event.get("requestContext") or not event["requestContext"].get("http") or not (event["requestContext"]["http"].get("method") == 'GET'):
@@ -83,186 +262,216 @@ def handler(event, context=None):
     # The remaining elements form the original image path
     originalImagePath = '/'.join(imagePathArray)
     
+    # Serve recently transformed images straight from memory
+    cacheKey = (originalImagePath, operationsPrefix)
+    cachedImage = get_cached_image(cacheKey)
+    if cachedImage is not None:
+        logger.info(f"Serving transformed image '{originalImagePath}/{operationsPrefix}' from memory cache")
+        contentType, transformedImageBytes = cachedImage
+        return sendImage(contentType, transformedImageBytes, 'img-cache;desc=hit')
+    
     startTime = time.perf_counter() * 1000
-    # Download the original image from S3
-    try:
-        # Determine the bucket/ARN to use for fetching
-        fetch_bucket = S3_ORIGINAL_MRAP_ARN if S3_ORIGINAL_MRAP_ARN else S3_ORIGINAL_IMAGE_BUCKET
-        logger.info(f"Fetching original image '{originalImagePath}' from bucket/ARN '{fetch_bucket}' using endpoint '{original_bucket_s3_client.meta.endpoint_url}'")
+    # Determine the bucket/ARN to use for fetching
+    fetch_bucket = S3_ORIGINAL_MRAP_ARN if S3_ORIGINAL_MRAP_ARN else S3_ORIGINAL_IMAGE_BUCKET
+    logger.info(f"Fetching original image '{originalImagePath}' from bucket/ARN '{fetch_bucket}' using endpoint '{original_bucket_s3_client.meta.endpoint_url}'")
+    # Start downloading the original image from S3 in the background
+    getOriginalImageFuture = download_executor.submit(download_original_image, fetch_bucket, originalImagePath)
+
+    # Process the requested operations while the download is in flight
+    operationsJSON = dict(OPERATIONS_PATTERN.findall(operationsPrefix))
 
-        getOriginalImageCommandOutput = original_bucket_s3_client.get_object(Bucket=fetch_bucket, Key=originalImagePath)
+    # Wait for the original image download to complete
+    try:
+        contentType, originalImageStream = getOriginalImageFuture.result()
         logger.info(f"Successfully downloaded {originalImagePath}")
-        originalImageBody = getOriginalImageCommandOutput["Body"].read()
-        contentType = getOriginalImageCommandOutput.get("ContentType")
         
         # If the image is an SVG, return it as-is without any processing
         if contentType and 'svg' in contentType.lower():
             logger.info("SVG image detected, returning as-is")
             return {
                 'statusCode': 200,
-                'headers': {
-                    'Content-Type': contentType,
-                    'Cache-Control': f'max-age={TRANSFORMED_IMAGE_CACHE_TTL}'
-                },
-                'body': base64.b64encode(originalImageBody).decode('utf-8'),
+                'headers': {**RESPONSE_HEADERS, 'Content-Type': contentType},
+                'body': base64.b64encode(originalImageStream.read()).decode('utf-8'),
                 'isBase64Encoded': True
             }
 
+        # Without a resize or quality request the original may be served as-is, so keep its bytes around
+        originalImageBody = None
+        if 'width' not in operationsJSON and 'height' not in operationsJSON and 'quality' not in operationsJSON:
+            originalImageBody = originalImageStream.read()
+            # BytesIO shares the bytes object, so this doesn't copy the original
+            originalImageStream = io.BytesIO(originalImageBody)
+
     except Exception as error:
         return sendError(500, 'Error downloading original image', error)
-    
-    # Open the image using Pillow
+
+    # Open the image using Pillow, straight from the S3 stream unless its bytes were read above. The S3 stream can't seek,
+    # so Pillow reads it into its own in-memory buffer and memory use is the same as reading it up front.
+    # Only the header is parsed here, pixel data is decoded lazily on first access (e.g. resize or save).
     try:
-        transformedImage = Image.open(io.BytesIO(originalImageBody))
+        transformedImage = Image.open(originalImageStream)
     except Exception as error:
         return sendError(500, 'Error opening original image', error)
-    
-    # Get image orientation from EXIF to auto-rotate if needed
-    imageMetadata = transformedImage._getexif() if hasattr(transformedImage, "_getexif") else None
-    
-    # Process the requested operations
-    operationsParts = operationsPrefix.split(',')
-    operationsJSON = dict(op.split('=') for op in operationsParts if '=' in op)
-    
+
+    # Remember the original format, resizing returns an image without one
+    imageFormat = transformedImage.format
+
+    # If the original is already in the requested format, serve its bytes instead of decoding and re-encoding them.
+    # The format comes from the image header, not the S3 Content-Type, which may be missing or wrong. Originals
+    # carrying EXIF or XMP metadata still go through the pipeline so that metadata is never served and orientation is applied.
+    originalFormat = PASS_THROUGH_FORMATS.get(imageFormat)
+    isPassThrough = originalImageBody is not None and originalFormat is not None \
+        and operationsJSON.get('format', originalFormat) == originalFormat \
+        and not any(marker in originalImageBody for marker in METADATA_MARKERS)
+
     # Track timing for diagnostics
     timingLog = 'img-download;dur=' + str(int(time.perf_counter() * 1000 - startTime))
-    startTime = time.perf_counter() * 1000
+
+    if isPassThrough:
+        logger.info("Original image already matches the requested operations, returning as-is")
+        contentType = f'image/{originalFormat}'
+        transformedImageBytes = originalImageBody
+    else:
+        startTime = time.perf_counter() * 1000
     
-    try:
-        # Resize image if width or height is provided
-        resizingOptions = {}
-        if 'width' in operationsJSON:
-            resizingOptions['width'] = int(operationsJSON['width'])
-        if 'height' in operationsJSON:
-            resizingOptions['height'] = int(operationsJSON['height'])
-        if resizingOptions:
-            orig_width, orig_height = transformedImage.size
-            new_width = resizingOptions.get('width')
-            new_height = resizingOptions.get('height')
-            # Calculate the missing dimension to maintain aspect ratio if only one is provided
-            if new_width and not new_height:
-                new_height = int((orig_height * new_width) / orig_width)
-            elif new_height and not new_width:
-                new_width = int((orig_width * new_height) / orig_height)
-            transformedImage = transformedImage.resize((new_width, new_height))
+        try:
+            # Resize image if width or height is provided
+            resizingOptions = {}
+            if 'width' in operationsJSON:
+                resizingOptions['width'] = int(operationsJSON['width'])
+            if 'height' in operationsJSON:
+                resizingOptions['height'] = int(operationsJSON['height'])
+            if resizingOptions:
+                orig_width, orig_height = transformedImage.size
+                new_width = resizingOptions.get('width')
+                new_height = resizingOptions.get('height')
+                # Calculate the missing dimension to maintain aspect ratio if only one is provided
+                if new_width and not new_height:
+                    new_height = int((orig_height * new_width) / orig_width)
+                elif new_height and not new_width:
+                    new_width = int((orig_width * new_height) / orig_height)
+                # Leave the image untouched when the requested size is the original size,
+                # resize() would otherwise return a full pixel copy of it
+                if (new_width, new_height) != (orig_width, orig_height):
+                    # Use bilinear for moderate scaling, where it is visually indistinguishable and much cheaper,
+                    # and Lanczos for large down/upscales, unless a filter is explicitly requested
+                    ratio = max(new_width / orig_width, new_height / orig_height)
+                    defaultFilter = Image.Resampling.BILINEAR if 0.5 <= ratio <= 2 else Image.Resampling.LANCZOS
+                    resample = RESAMPLING_FILTERS.get(operationsJSON.get('filter'), defaultFilter)
+                    # For large JPEG downscales, let libjpeg decode at a reduced DCT scale (1/2, 1/4 or 1/8)
+                    # that stays at least twice the target size, then resize the remainder.
+                    if transformedImage.format == 'JPEG' and new_width * 2 < orig_width and new_height * 2 < orig_height:
+                        transformedImage.draft(transformedImage.mode, (new_width * 2, new_height * 2))
+                    # reducing_gap lets Pillow shrink large downscales with the fast box reduce before resampling
+                    transformedImage = transformedImage.resize((new_width, new_height), resample, reducing_gap=2.0)
         
-        # Auto-rotate the image based on EXIF data if available
-        if imageMetadata and 274 in imageMetadata:
-            transformedImage = ImageOps.exif_transpose(transformedImage)
+            # Auto-rotate the image based on EXIF data if available. Only formats that can carry EXIF are checked,
+            # and this runs after resizing so the rotation works on the smaller image.
+            if imageFormat in EXIF_FORMATS and transformedImage.getexif().get(274, 1) != 1:
+                transformedImage = ImageOps.exif_transpose(transformedImage)
         
-        # Check if formatting is requested
-        if 'format' in operationsJSON:
-            fmt = operationsJSON['format']
-            isLossy = False
-            if fmt == 'jpeg':
-                contentType = 'image/jpeg'
-                isLossy = True
-                # Convert image to RGB if it has transparency (alpha channel)
-                if transformedImage.mode in ('RGBA', 'LA') or (transformedImage.mode == 'P' and 'transparency' in transformedImage.info):
-                    transformedImage = transformedImage.convert('RGB')
-            elif fmt == 'gif':
-                contentType = 'image/gif'
-            elif fmt == 'webp':
-                contentType = 'image/webp'
-                isLossy = True
-                # Preserve transparency for WebP format
-                if transformedImage.mode in ('RGBA', 'LA') or (transformedImage.mode == 'P' and 'transparency' in transformedImage.info):
-                    # Keep the image in RGBA mode to preserve transparency
-                    if transformedImage.mode != 'RGBA':
-                        transformedImage = transformedImage.convert('RGBA')
-            elif fmt == 'png':
-                contentType = 'image/png'
-            elif fmt == 'avif':
-                contentType = 'image/avif'
-                isLossy = True
-                # Preserve transparency for AVIF format
-                if transformedImage.mode in ('RGBA', 'LA') or (transformedImage.mode == 'P' and 'transparency' in transformedImage.info):
-                    # Keep the image in RGBA mode to preserve transparency
-                    if transformedImage.mode != 'RGBA':
-                        transformedImage = transformedImage.convert('RGBA')
-            else:
-                # Default to JPEG if an unsupported format is specified
-                contentType = 'image/jpeg'
-                isLossy = True
-                if transformedImage.mode in ('RGBA', 'LA') or (transformedImage.mode == 'P' and 'transparency' in transformedImage.info):
-                    transformedImage = transformedImage.convert('RGB')
+            # Check if formatting is requested
+            if 'format' in operationsJSON:
+                fmt = operationsJSON['format']
+                isLossy = False
+                if fmt == 'jpeg':
+                    contentType = 'image/jpeg'
+                    isLossy = True
+                    # Convert image to a JPEG mode, dropping transparency (alpha channel)
+                    transformedImage = to_jpeg_compatible(transformedImage)
+                elif fmt == 'gif':
+                    contentType = 'image/gif'
+                elif fmt == 'webp':
+                    contentType = 'image/webp'
+                    isLossy = True
+                    # Preserve transparency for WebP format
+                    if transformedImage.mode in ('RGBA', 'LA') or (transformedImage.mode == 'P' and 'transparency' in transformedImage.info):
+                        # Keep the image in RGBA mode to preserve transparency
+                        if transformedImage.mode != 'RGBA':
+                            transformedImage = transformedImage.convert('RGBA')
+                elif fmt == 'png':
+                    contentType = 'image/png'
+                elif fmt == 'avif':
+                    contentType = 'image/avif'
+                    isLossy = True
+                    # Preserve transparency for AVIF format
+                    if transformedImage.mode in ('RGBA', 'LA') or (transformedImage.mode == 'P' and 'transparency' in transformedImage.info):
+                        # Keep the image in RGBA mode to preserve transparency
+                        if transformedImage.mode != 'RGBA':
+                            transformedImage = transformedImage.convert('RGBA')
+                else:
+                    # Default to JPEG if an unsupported format is specified
+                    contentType = 'image/jpeg'
+                    isLossy = True
+                    transformedImage = to_jpeg_compatible(transformedImage)
         
-            # Set the output format accordingly
-            output_format = fmt.upper() if fmt != 'jpeg' else 'JPEG'
-            # Prepare any save parameters (such as quality for lossy formats)
-            save_kwargs = {}
-            quality = int(operationsJSON.get('quality', DEFAULT_IMAGE_QUALITY))
-
-            # Save the transformed image to a buffer
-            if contentType:
-                buffer = io.BytesIO()
-                # Use quality setting for all formats
-                save_kwargs = {'quality': quality}
+                # Set the output format accordingly
+                output_format = fmt.upper() if fmt != 'jpeg' else 'JPEG'
+                # Prepare any save parameters (such as quality for lossy formats)
+                save_kwargs = {}
+                quality = int(operationsJSON.get('quality', DEFAULT_IMAGE_QUALITY))
+
+                # Save the transformed image to a buffer
+                if contentType:
+                    buffer = io.BytesIO()
+                    # Use quality setting for all formats
+                    save_kwargs = {'quality': quality}
+                
+                    # For WebP, enable transparency support
+                    if fmt == 'webp' and transformedImage.mode in ('RGBA', 'LA'):
+                        save_kwargs['lossless'] = False  # Set to True for lossless WebP if needed
+                        save_kwargs['method'] = 6  # Better compression method
                 
-                # For WebP, enable transparency support
-                if fmt == 'webp' and transformedImage.mode in ('RGBA', 'LA'):
-                    save_kwargs['lossless'] = False  # Set to True for lossless WebP if needed
-                    save_kwargs['method'] = 6  # Better compression method
+                    # For AVIF, select the encoder and speed preset (e.g. avifCodec=svt for SVT-AV1 still-image encoding)
+                    if fmt == 'avif':
+                        save_kwargs['codec'] = AVIF_CODEC
+                        save_kwargs['speed'] = AVIF_SPEED
                 
-                # For AVIF, enable transparency support
-                if fmt == 'avif' and transformedImage.mode in ('RGBA', 'LA'):
-                    save_kwargs['lossless'] = False  # Set to True for lossless AVIF if needed
+                    # For AVIF, enable transparency support
+                    if fmt == 'avif' and transformedImage.mode in ('RGBA', 'LA'):
+                        save_kwargs['lossless'] = False  # Set to True for lossless AVIF if needed
                 
-                transformedImage.save(buffer, format=fmt.upper(), **save_kwargs)
+                    transformedImage.save(buffer, format=fmt.upper(), **save_kwargs)
+                    # getvalue() hands over the buffer's own bytes object rather than copying it
+                    transformedImageBytes = buffer.getvalue()
+                    logger.info(f"Successfully transformed image to format: {fmt}")
+            else:
+                # If no explicit format is requested, maintain the original format.
+                # For example, if the image is an SVG, convert it to PNG. Since Pillow does not support saving SVGs directly,
+                # we need to convert it to a raster format first.
+                if contentType == 'image/svg+xml':
+                    contentType = 'image/png'
+                buffer = io.BytesIO()
+                # Save using the original image format if available, otherwise default to PNG.
+                transformedImage.save(buffer, format=transformedImage.format if transformedImage.format else 'PNG')
                 transformedImageBytes = buffer.getvalue()
-                logger.info(f"Successfully transformed image to format: {fmt}")
-        else:
-            # If no explicit format is requested, maintain the original format.
-            # For example, if the image is an SVG, convert it to PNG. Since Pillow does not support saving SVGs directly,
-            # we need to convert it to a raster format first.
-            if contentType == 'image/svg+xml':
-                contentType = 'image/png'
-            buffer = io.BytesIO()
-            # Save using the original image format if available, otherwise default to PNG.
-            transformedImage.save(buffer, format=transformedImage.format if transformedImage.format else 'PNG')
-            transformedImageBytes = buffer.getvalue()
-    except Exception as error:
-        return sendError(500, 'Error transforming image', error)
+        except Exception as error:
+            return sendError(500, 'Error transforming image', error)
+    
+        timingLog = timingLog + ',img-transform;dur=' + str(int(time.perf_counter() * 1000 - startTime))
     
-    timingLog = timingLog + ',img-transform;dur=' + str(int(time.perf_counter() * 1000 - startTime))
+    cache_image(cacheKey, contentType, transformedImageBytes)
     
-    # Upload the transformed image back to S3 if a bucket is specified
+    # Upload the transformed image back to S3 if a bucket is specified.
+    # Lambda freezes the environment as soon as the handler returns, which would suspend or cut off the upload.
+    # A lost upload sends the next CloudFront miss back through a full transform, so wait for it here.
+    # Past the timeout the cache fill is best-effort only and may be lost.
     if S3_TRANSFORMED_IMAGE_BUCKET:
         startTime = time.perf_counter() * 1000
-        try:
-            # Determine the bucket/ARN to use for uploading
-            upload_bucket = S3_TRANSFORMED_MRAP_ARN if S3_TRANSFORMED_MRAP_ARN else S3_TRANSFORMED_IMAGE_BUCKET
-            upload_key = f"{originalImagePath}/{operationsPrefix}"
-            logger.info(f"Uploading transformed image to bucket/ARN '{upload_bucket}' with key '{upload_key}' using endpoint '{transformed_bucket_s3_client.meta.endpoint_url}'")
-
-            transformed_bucket_s3_client.put_object(
-                Bucket=upload_bucket,
-                Key=upload_key,
-                Body=transformedImageBytes,
-                ContentType=contentType,
-                CacheControl=f'max-age={TRANSFORMED_IMAGE_CACHE_TTL}',
-                Tagging=f'transformedIn={TRANSFORM_REGION}',
-                Metadata={
-                    'original-image-key': originalImagePath,
-                    'transformations': operationsPrefix,
-                    'transformedIn': TRANSFORM_REGION
-                }
-            )
-            timingLog = timingLog + ',img-upload;dur=' + str(int(time.perf_counter() * 1000 - startTime))
-        except Exception as error:
-            logError('Could not upload transformed image to S3', error)
+        uploadFuture = upload_executor.submit(upload_transformed_image, transformedImageBytes, contentType, originalImagePath, operationsPrefix)
+        done, _ = concurrent.futures.wait([uploadFuture], timeout=UPLOAD_WAIT_TIMEOUT)
+        if not done:
+            logger.warning(f"Upload of transformed image '{originalImagePath}/{operationsPrefix}' did not finish within {UPLOAD_WAIT_TIMEOUT}s, returning without it")
+        timingLog = timingLog + ',img-upload;dur=' + str(int(time.perf_counter() * 1000 - startTime))
 
-    response_headers = {
-        'Content-Type': contentType,
-        'Cache-Control': f'max-age={TRANSFORMED_IMAGE_CACHE_TTL}',
-        'x-transformed-in': TRANSFORM_REGION,
-        'Server-Timing': timingLog
-    }
-    response_headers['Content-Type'] = contentType
+    return sendImage(contentType, transformedImageBytes, timingLog)
+
+def sendImage(contentType, imageBytes, timingLog):
+    response_headers = {**RESPONSE_HEADERS, 'Content-Type': contentType, 'Server-Timing': timingLog}
     return {
         "statusCode": 200,
         "headers": response_headers,
-        "body": base64.b64encode(transformedImageBytes).decode('utf-8'),
+        "body": base64.b64encode(imageBytes).decode('utf-8'),
         "isBase64Encoded": True
     }
 
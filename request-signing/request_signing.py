@@ -1,10 +1,11 @@
+import functools
 import boto3
 from botocore import awsrequest
 from botocore import crt
 import urllib.parse
 
 failover_header = 'originTypeFailover'
-cf_read_only_headers_list = [h.lower() for h in [
+cf_read_only_headers_list = frozenset(h.lower() for h in [
     'Accept-Encoding',
     'Content-Length',
     'If-Modified-Since',
@@ -13,22 +14,32 @@ cf_read_only_headers_list = [h.lower() for h in [
     'If-Unmodified-Since',
     'Transfer-Encoding',
     'Via'
-]]
+])
 
 
 class SigV4AWrapper:
 
     def __init__(self):
         self._session = boto3.Session()
+        # Resolve the credential chain once. Refreshable credentials still refresh themselves when the signer reads them.
+        self._creds = self._session.get_credentials()
+
+    @functools.lru_cache(maxsize=None)
+    def _get_signer(self, service, region):
+        return crt.auth.CrtS3SigV4AsymAuth(self._creds, service, region)
 
     def get_auth_headers(self, method, endpoint, data, region, service, headers, params=None):
-        sigv4a = crt.auth.CrtS3SigV4AsymAuth(self._session.get_credentials(), service, region)
+        sigv4a = self._get_signer(service, region)
         request = awsrequest.AWSRequest(method=method, url=endpoint, data=data, headers=headers, params=params)
         sigv4a.add_auth(request)
         prepped = request.prepare()
         return prepped.headers
 
 
+# Created once per execution environment and reused across invocations
+sigv4a_wrapper = SigV4AWrapper()
+
+
 def handler(event, context):
     request = event['Records'][0]['cf']['request']
 
@@ -60,40 +71,28 @@ def handler(event, context):
     service = 's3'
 
     headers = request["headers"]
-    request_headers_list = [h.lower() for h in headers.keys()]
+    # Map lowercase header names to the actual (case-sensitive) header keys
+    lc_map = {k.lower(): k for k in headers}
 
     signing_headers = {}
     
     # Include CloudFront read-only headers that must be part of the signature
     for h in cf_read_only_headers_list:
-        if h in request_headers_list:
-            # Find the actual header key (case-sensitive)
-            for header_key in headers.keys():
-                if header_key.lower() == h:
-                    signing_headers[headers[header_key][0]['key']] = headers[header_key][0]['value']
-                    break
+        header_key = lc_map.get(h)
+        if header_key is not None:
+            header = headers[header_key][0]
+            signing_headers[header['key']] = header['value']
 
     # Add required headers for S3 signing
     signing_headers['Host'] = domain_name
     signing_headers['X-Amz-Cf-Id'] = event['Records'][0]['cf']['config']['requestId']
 
     # Handle query string parameters if they exist
-    params = None
     querystring = request.get('querystring', '')
-    if querystring:
-        params = {}
-        for param_pair in querystring.split('&'):
-            if '=' in param_pair:
-                key, value = param_pair.split('=', 1)
-                key = urllib.parse.unquote_plus(key)
-                value = urllib.parse.unquote_plus(value)
-                params[key] = value
-            else:
-                key = urllib.parse.unquote_plus(param_pair)
-                params[key] = ''
+    params = dict(urllib.parse.parse_qsl(querystring, keep_blank_values=True)) if querystring else None
 
     # Sign the request with SigV4A
-    auth_headers = SigV4AWrapper().get_auth_headers(method, endpoint, data, region, service, signing_headers, params)
+    auth_headers = sigv4a_wrapper.get_auth_headers(method, endpoint, data, region, service, signing_headers, params)
 
     # Remove X-Amz-Cf-Id as CloudFront will add it automatically
     auth_headers.pop('X-Amz-Cf-Id', None)
@@ -1,4 +1,5 @@
 var SUPPORTED_FORMATS = ['auto', 'jpeg', 'webp', 'avif', 'png', 'svg', 'gif'];
+var SUPPORTED_FILTERS = ['nearest', 'box', 'bilinear', 'hamming', 'bicubic', 'lanczos'];
 var MAX_DIMENSION = 4000; // Example: set a max for width/height for protection
 
 function parsePositiveInt(value, max) {
@@ -72,6 +73,11 @@ function handler(event) {
                         if (quality) normalizedOperations['quality'] = quality.toString();
                         break;
                     }
+                    case 'filter':
+                        if (value && SUPPORTED_FILTERS.indexOf(value.toLowerCase()) !== -1) {
+                            normalizedOperations['filter'] = value.toLowerCase();
+                        }
+                        break;
                     default:
                         break;
                 }
@@ -89,6 +95,7 @@ function handler(event) {
     if (normalizedOperations.quality) normalizedOperationsArray.push('quality=' + encodeURIComponent(normalizedOperations.quality));
     if (normalizedOperations.width) normalizedOperationsArray.push('width=' + encodeURIComponent(normalizedOperations.width));
     if (normalizedOperations.height) normalizedOperationsArray.push('height=' + encodeURIComponent(normalizedOperations.height));
+    if (normalizedOperations.filter) normalizedOperationsArray.push('filter=' + encodeURIComponent(normalizedOperations.filter));
 
     // URL encode the entire operations string to ensure proper path encoding
     request.uri = originalImagePath + '/' + encodeURIComponent(normalizedOperationsArray.join(','));